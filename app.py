@@ -1,10 +1,47 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
 
+from cache import redis_client
+from ingest_queue import run_flusher, stop_flusher
+from partitions import run_partition_maintenance
 from routers.api import router
 from settings import settings
+from static_assets import STATIC_DIR, VersionedStaticFiles
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    partitions = asyncio.create_task(run_partition_maintenance())
+    flusher = asyncio.create_task(run_flusher())
+    yield
+    await stop_flusher(flusher)
+    partitions.cancel()
+    with suppress(asyncio.CancelledError):
+        await partitions
+    await redis_client.aclose()
+
 
 app = FastAPI(
-    title="BLE API", description="API para gerenciamento de tags BLE", version="1.0.0"
+    title="BLE API",
+    description="API para gerenciamento de tags BLE",
+    version="1.0.0",
+    lifespan=lifespan,
+    # Respostas JSON de todas as rotas serializadas com orjson
+    default_response_class=ORJSONResponse,
 )
 
+# Respostas pequenas (ex.: /ingest) não compensam a compressão
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
 app.include_router(router)
+
+# CSS/JS do mapa, servidos como arquivos para o navegador manter em cache
+app.mount(
+    "/static",
+    VersionedStaticFiles(directory=STATIC_DIR),
+    name="static",
+)
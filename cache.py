@@ -0,0 +1,41 @@
+"""Cache Redis para respostas lidas com frequência"""
+
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from settings import settings
+
+STATS_KEY = "stats:all"
+
+# Timeouts curtos: se o Redis estiver fora, a API segue respondendo pelo banco
+redis_client = Redis.from_url(
+    settings.REDIS_URL,
+    socket_timeout=settings.REDIS_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_TIMEOUT,
+)
+
+
+async def get_cached(key: str) -> Optional[bytes]:
+    """Retorna o valor em cache ou None se não existir (ou o Redis falhar)"""
+    try:
+        return await redis_client.get(key)
+    except RedisError:
+        return None
+
+
+async def set_cached(key: str, value: bytes, ttl: int) -> None:
+    """Grava o valor com expiração em segundos"""
+    try:
+        await redis_client.setex(key, ttl, value)
+    except RedisError:
+        pass
+
+
+async def invalidate(key: str) -> None:
+    """Remove a chave do cache"""
+    try:
+        await redis_client.delete(key)
+    except RedisError:
+        pass
@@ -0,0 +1,104 @@
+"""Fila de ingestão: junta as leituras de várias requisições em poucos INSERTs"""
+
+import asyncio
+import logging
+from typing import List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from cache import STATS_KEY, invalidate
+from database import GatewayModel, TagModel, get_session_context
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Cada item é a lista de leituras de uma requisição; None encerra o flusher
+queue: "asyncio.Queue[Optional[List[dict]]]" = asyncio.Queue(
+    maxsize=settings.INGEST_QUEUE_MAXSIZE
+)
+
+
+async def enqueue(rows: List[dict]) -> None:
+    """Agenda as leituras para o próximo lote (aguarda se a fila estiver cheia)"""
+    await queue.put(rows)
+
+
+async def _insert(rows: List[dict]) -> None:
+    async with get_session_context() as session:
+        # gateway_mac é FK para gateways.mac: leituras de gateways não
+        # cadastrados são gravadas sem gateway em vez de derrubar o INSERT
+        # do lote inteiro (uma consulta por lote, na mesma transação)
+        gateway_macs = {row["gateway_mac"] for row in rows} - {None}
+        if gateway_macs:
+            result = await session.execute(
+                select(GatewayModel.mac).where(GatewayModel.mac.in_(gateway_macs))
+            )
+            known = {bytes.fromhex(mac) for mac in result.scalars()}
+            if known != gateway_macs:
+                rows = [
+                    row if row["gateway_mac"] in known else {**row, "gateway_mac": None}
+                    for row in rows
+                ]
+        await session.execute(insert(TagModel), rows)
+
+
+async def _write(chunks: List[List[dict]]) -> None:
+    """Grava o lote em uma única transação"""
+    try:
+        await _insert([row for chunk in chunks for row in chunk])
+    except SQLAlchemyError:
+        # Uma requisição inválida (ex.: battery_level fora do intervalo de
+        # INTEGER) não deve descartar as leituras das outras: tenta cada uma
+        # separadamente
+        logger.warning("Falha ao gravar lote de %d requisições", len(chunks))
+        for chunk in chunks:
+            try:
+                await _insert(chunk)
+            except SQLAlchemyError:
+                logger.exception("Descartando %d leituras", len(chunk))
+    await invalidate(STATS_KEY)
+
+
+async def run_flusher() -> None:
+    """
+    Consome a fila gravando um lote a cada INGEST_BATCH_SIZE leituras ou
+    INGEST_FLUSH_INTERVAL segundos, o que ocorrer primeiro.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            return
+
+        chunks = [chunk]
+        size = len(chunk)
+        stop = False
+        deadline = loop.time() + settings.INGEST_FLUSH_INTERVAL
+        while size < settings.INGEST_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(queue.get(), timeout)
+            except TimeoutError:
+                break
+            if chunk is None:
+                stop = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+
+        try:
+            await _write(chunks)
+        except Exception:
+            # O flusher não pode morrer, senão a fila enche e o /ingest trava
+            logger.exception("Erro inesperado ao gravar lote de leituras")
+        if stop:
+            return
+
+
+async def stop_flusher(task: asyncio.Task) -> None:
+    """Pede o encerramento do flusher após gravar o que ainda está na fila"""
+    await queue.put(None)
+    await task
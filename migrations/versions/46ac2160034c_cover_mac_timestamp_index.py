@@ -0,0 +1,41 @@
+"""cover mac timestamp index
+
+Revision ID: 46ac2160034c
+Revises: dcbf1909147a
+Create Date: 2026-10-14 11:40:05.118392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '46ac2160034c'
+down_revision: Union[str, Sequence[str], None] = 'dcbf1909147a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index('idx_mac_ts_desc_covering', table_name='tags')
+    op.create_index(
+        'idx_mac_ts_desc_covering',
+        'tags',
+        ['mac', sa.text('timestamp DESC')],
+        unique=False,
+        postgresql_include=['id', 'rssi', 'gateway_mac', 'battery_level'],
+    )
+    # Redundantes: (mac) e (mac, timestamp) são prefixos do índice acima
+    op.drop_index('idx_mac_timestamp', table_name='tags')
+    op.drop_index(op.f('ix_tags_mac'), table_name='tags')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_tags_mac'), 'tags', ['mac'], unique=False)
+    op.create_index('idx_mac_timestamp', 'tags', ['mac', 'timestamp'], unique=False)
+    op.drop_index('idx_mac_ts_desc_covering', table_name='tags')
+    op.create_index('idx_mac_ts_desc_covering', 'tags', ['mac', sa.text('timestamp DESC')], unique=False)
@@ -0,0 +1,94 @@
+"""store mac as bytea
+
+Revision ID: 7bb49909d8b8
+Revises: 46ac2160034c
+Create Date: 2026-10-14 14:03:27.551806
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7bb49909d8b8'
+down_revision: Union[str, Sequence[str], None] = '46ac2160034c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'tags_gateway_mac_fkey'
+
+
+def _hex(column: str) -> str:
+    """Expressão SQL com os 12 dígitos hexadecimais do MAC, sem separadores"""
+    return f"regexp_replace({column}, '[:.-]', '', 'g')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Gateways são cadastros: em vez de descartá-los, a migração para e lista
+    # os MACs que não cabem em 6 bytes (o cadastro antigo aceitava qualquer
+    # texto alfanumérico) para que sejam corrigidos à mão
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            invalid text;
+        BEGIN
+            SELECT string_agg(format('id=%s name=%s mac=%s', id, name, mac), ', ')
+            INTO invalid
+            FROM gateways
+            WHERE {_hex('mac')} !~* '^[0-9a-f]{{12}}$';
+
+            IF invalid IS NOT NULL THEN
+                RAISE EXCEPTION 'Gateways com MAC inválido (esperados 12 dígitos hexadecimais): %', invalid
+                    USING HINT = 'Corrija o MAC desses gateways ou remova-os e rode a migração de novo';
+            END IF;
+        END $$
+        """
+    )
+
+    op.drop_constraint(FK_NAME, 'tags', type_='foreignkey')
+
+    # Leituras que não são MACs válidos não têm representação em 6 bytes
+    op.execute(f"DELETE FROM tags WHERE {_hex('mac')} !~* '^[0-9a-f]{{12}}$'")
+    op.execute(
+        f"UPDATE tags SET gateway_mac = NULL WHERE {_hex('gateway_mac')} !~* '^[0-9a-f]{{12}}$'"
+    )
+
+    op.alter_column(
+        'gateways', 'mac', type_=sa.LargeBinary(length=6),
+        postgresql_using=f"decode({_hex('mac')}, 'hex')",
+    )
+    op.alter_column(
+        'tags', 'mac', type_=sa.LargeBinary(length=6),
+        postgresql_using=f"decode({_hex('mac')}, 'hex')",
+    )
+    op.alter_column(
+        'tags', 'gateway_mac', type_=sa.LargeBinary(length=6),
+        postgresql_using=f"decode({_hex('gateway_mac')}, 'hex')",
+    )
+
+    op.create_foreign_key(FK_NAME, 'tags', 'gateways', ['gateway_mac'], ['mac'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(FK_NAME, 'tags', type_='foreignkey')
+
+    op.alter_column(
+        'tags', 'gateway_mac', type_=sa.String(),
+        postgresql_using="encode(gateway_mac, 'hex')",
+    )
+    # Tags voltam ao formato aa:bb:cc:dd:ee:ff usado pelo /ingest
+    op.alter_column(
+        'tags', 'mac', type_=sa.String(),
+        postgresql_using=r"regexp_replace(encode(mac, 'hex'), '(..)(?!$)', '\1:', 'g')",
+    )
+    op.alter_column(
+        'gateways', 'mac', type_=sa.String(),
+        postgresql_using="encode(mac, 'hex')",
+    )
+
+    op.create_foreign_key(FK_NAME, 'tags', 'gateways', ['gateway_mac'], ['mac'], ondelete='SET NULL')
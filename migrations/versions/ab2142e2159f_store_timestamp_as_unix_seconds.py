@@ -0,0 +1,35 @@
+"""store timestamp as unix seconds
+
+Revision ID: ab2142e2159f
+Revises: 7bb49909d8b8
+Create Date: 2026-10-14 15:21:48.207713
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ab2142e2159f'
+down_revision: Union[str, Sequence[str], None] = '7bb49909d8b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Os datetimes eram gravados sem fuso no horário local do container (UTC)
+    op.alter_column(
+        'tags', 'timestamp', type_=sa.BigInteger(),
+        postgresql_using='EXTRACT(EPOCH FROM "timestamp")::bigint',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        'tags', 'timestamp', type_=sa.DateTime(),
+        postgresql_using="to_timestamp(\"timestamp\") AT TIME ZONE 'UTC'",
+    )
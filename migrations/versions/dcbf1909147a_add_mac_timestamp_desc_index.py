@@ -0,0 +1,28 @@
+"""add mac timestamp desc index
+
+Revision ID: dcbf1909147a
+Revises: 3f8a02b537a0
+Create Date: 2026-10-14 09:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'dcbf1909147a'
+down_revision: Union[str, Sequence[str], None] = '3f8a02b537a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('idx_mac_ts_desc_covering', 'tags', ['mac', sa.text('timestamp DESC')], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_mac_ts_desc_covering', table_name='tags')
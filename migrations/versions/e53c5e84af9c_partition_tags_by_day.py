@@ -0,0 +1,116 @@
+"""partition tags by day
+
+Revision ID: e53c5e84af9c
+Revises: ab2142e2159f
+Create Date: 2026-10-14 17:46:12.630954
+
+"""
+import time
+from datetime import datetime, timezone
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e53c5e84af9c'
+down_revision: Union[str, Sequence[str], None] = 'ab2142e2159f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DAY = 86400
+# Mesma janela padrão mantida por partitions.py (TAG_PARTITION_DAYS_BACK/AHEAD)
+DAYS_BACK = 7
+DAYS_AHEAD = 7
+
+COLUMNS = 'id, battery_level, mac, rssi, gateway_mac, "timestamp"'
+
+
+def _create_indexes() -> None:
+    op.create_index(
+        'idx_mac_ts_desc_covering',
+        'tags',
+        ['mac', sa.text('timestamp DESC')],
+        unique=False,
+        postgresql_include=['id', 'rssi', 'gateway_mac', 'battery_level'],
+    )
+    op.create_index(op.f('ix_tags_timestamp'), 'tags', ['timestamp'], unique=False)
+
+
+def _move_aside(name: str) -> None:
+    """Renomeia a tabela tags atual e libera os nomes de índices e constraints"""
+    op.rename_table('tags', name)
+    op.execute(f'ALTER TABLE {name} RENAME CONSTRAINT tags_pkey TO {name}_pkey')
+    op.drop_index('idx_mac_ts_desc_covering', table_name=name)
+    op.drop_index(op.f('ix_tags_timestamp'), table_name=name)
+
+
+def _copy_from(name: str) -> None:
+    op.execute(f'INSERT INTO tags ({COLUMNS}) SELECT {COLUMNS} FROM {name}')
+    # O sequence do id passa a pertencer à nova tabela antes de remover a antiga
+    op.execute('ALTER SEQUENCE tags_id_seq OWNED BY tags.id')
+    op.drop_table(name)
+
+
+def _columns() -> list:
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('tags_id_seq')"), nullable=False),
+        sa.Column('battery_level', sa.Integer(), nullable=True),
+        sa.Column('mac', sa.LargeBinary(length=6), nullable=False),
+        sa.Column('rssi', sa.Integer(), nullable=False),
+        sa.Column('gateway_mac', sa.LargeBinary(length=6), nullable=True),
+        sa.Column('timestamp', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['gateway_mac'], ['gateways.mac'], name='tags_gateway_mac_fkey', ondelete='SET NULL'
+        ),
+    ]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _move_aside('tags_old')
+
+    op.create_table(
+        'tags',
+        *_columns(),
+        # A chave de partição precisa fazer parte da chave primária
+        sa.PrimaryKeyConstraint('id', 'timestamp', name='tags_pkey'),
+        postgresql_partition_by='RANGE (timestamp)',
+    )
+    _create_indexes()
+
+    # Todo dia com leituras no histórico ganha a sua partição, para que
+    # tags_default comece vazia e a retenção alcance também as linhas antigas
+    today = int(time.time()) // DAY * DAY
+    days = set(range(today - DAYS_BACK * DAY, today + (DAYS_AHEAD + 1) * DAY, DAY))
+    if not context.is_offline_mode():
+        result = op.get_bind().execute(
+            sa.text(f'SELECT DISTINCT "timestamp" / {DAY} * {DAY} FROM tags_old')
+        )
+        days.update(result.scalars())
+
+    for day_start in sorted(days):
+        name = 'tags_p' + datetime.fromtimestamp(day_start, timezone.utc).strftime('%Y%m%d')
+        op.execute(
+            f'CREATE TABLE {name} PARTITION OF tags '
+            f'FOR VALUES FROM ({day_start}) TO ({day_start + DAY})'
+        )
+    op.execute('CREATE TABLE tags_default PARTITION OF tags DEFAULT')
+
+    _copy_from('tags_old')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _move_aside('tags_partitioned')
+
+    op.create_table(
+        'tags',
+        *_columns(),
+        sa.PrimaryKeyConstraint('id', name='tags_pkey'),
+    )
+    _create_indexes()
+
+    # Remover a tabela particionada remove também as partições
+    _copy_from('tags_partitioned')
@@ -0,0 +1,135 @@
+"""
+Manutenção das partições da tabela tags (PARTITION BY RANGE (timestamp)).
+
+Cada dia UTC tem sua partição tags_pAAAAMMDD; tags_default só recebe linhas
+de dias sem partição, que o /ingest evita aceitando apenas timestamps dentro
+de ingest_window(). Queries com filtro de tempo só visitam as partições do
+intervalo, e remover histórico antigo é um DETACH + DROP em vez de DELETE.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from typing import Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import engine
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+# Serializa a manutenção entre os workers do gunicorn
+_LOCK_KEY = 4201402
+
+_PARTITION_NAME = re.compile(r"tags_p(\d{8})")
+
+
+def partition_name(day_start: int) -> str:
+    """Nome da partição do dia que começa em day_start (timestamp UTC)"""
+    return "tags_p" + datetime.fromtimestamp(day_start, timezone.utc).strftime("%Y%m%d")
+
+
+def partition_ddl(day_start: int) -> str:
+    """CREATE TABLE da partição de um dia"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(day_start)} PARTITION OF tags "
+        f"FOR VALUES FROM ({day_start}) TO ({day_start + DAY})"
+    )
+
+
+def partition_days_back() -> int:
+    """Dias passados mantidos com partição, limitado pela retenção"""
+    if settings.TAG_RETENTION_DAYS is None:
+        return settings.TAG_PARTITION_DAYS_BACK
+    return min(settings.TAG_PARTITION_DAYS_BACK, settings.TAG_RETENTION_DAYS)
+
+
+def ingest_window(now: int) -> Tuple[int, int]:
+    """
+    Intervalo [início, fim] de timestamps aceitos no /ingest. Fica dentro dos
+    dias que ensure_tag_partitions mantém criados, para que nenhuma leitura
+    caia em tags_default e impeça a criação da partição do seu dia.
+    """
+    return (
+        now - partition_days_back() * DAY,
+        now + settings.TAG_PARTITION_DAYS_AHEAD * DAY,
+    )
+
+
+async def _create_partition(day_start: int) -> None:
+    """Cria a partição de um dia na sua própria transação"""
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        await conn.execute(text(partition_ddl(day_start)))
+
+
+async def _drop_partition(name: str) -> None:
+    """Desanexa e remove uma partição na sua própria transação"""
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+        await conn.execute(text(f"ALTER TABLE tags DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE {name}"))
+
+
+async def ensure_tag_partitions() -> None:
+    """
+    Cria as partições dos últimos partition_days_back() dias, de hoje e dos
+    próximos TAG_PARTITION_DAYS_AHEAD dias e, se TAG_RETENTION_DAYS estiver
+    definido, remove as que ficaram mais antigas.
+
+    Cada partição é criada em uma transação separada: se um dia falhar (ex.:
+    tags_default já tem linhas desse dia), só ele é pulado.
+    """
+    today = int(time.time()) // DAY * DAY
+
+    for day in range(-partition_days_back(), settings.TAG_PARTITION_DAYS_AHEAD + 1):
+        day_start = today + day * DAY
+        try:
+            await _create_partition(day_start)
+        except SQLAlchemyError:
+            # As leituras desse dia continuam indo para tags_default
+            logger.exception("Partição %s não foi criada", partition_name(day_start))
+
+    if settings.TAG_RETENTION_DAYS is None:
+        return
+
+    cutoff = today - settings.TAG_RETENTION_DAYS * DAY
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'tags'::regclass"
+            )
+        )
+        names = result.scalars().all()
+
+    for name in names:
+        match = _PARTITION_NAME.fullmatch(name)
+        if not match:
+            continue
+        day = datetime.strptime(match.group(1), "%Y%m%d").replace(tzinfo=timezone.utc)
+        if int(day.timestamp()) + DAY > cutoff:
+            continue
+        try:
+            await _drop_partition(name)
+        except SQLAlchemyError:
+            logger.exception("Partição %s não foi removida", name)
+        else:
+            logger.info("Partição %s removida", name)
+
+
+async def run_partition_maintenance() -> None:
+    """Garante as partições ao subir e depois a cada TAG_PARTITION_CHECK_INTERVAL segundos"""
+    while True:
+        try:
+            await ensure_tag_partitions()
+        except Exception:
+            logger.exception("Falha na manutenção das partições de tags")
+        await asyncio.sleep(settings.TAG_PARTITION_CHECK_INTERVAL)
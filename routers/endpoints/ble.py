@@ -1,244 +1,311 @@
 """API FastAPI para gerenciamento de tags BLE/MQTT"""
 
-import hashlib
+import asyncio
+import logging
 import math
 import time
-from datetime import datetime, timedelta
-from typing import List, Optional, Tuple
-
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import desc, func, select
+import zlib
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import desc, exists, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from database import GatewayModel, TagModel, get_session_dependency
-from models import (IngestRequest, TagHistoryEntry, TagHistoryResponse,
-                    TagStatsResponse)
+from cache import STATS_KEY, get_cached, set_cached
+from database import GatewayModel, TagModel, get_session_dependency, parse_mac
+from ingest_queue import enqueue
+from models import IngestRequest, TagHistoryResponse, TagStatsResponse
+from partitions import ingest_window
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Casas decimais das posições das tags (6 casas ≈ 0,11 m). Com 5 casas
+# (≈ 1,1 m) o arredondamento seria do tamanho do deslocamento de 1-3 m em volta
+# do gateway e várias tags cairiam no mesmo ponto
+TAG_COORDINATE_DECIMALS = 6
 
 
-def humanize_datetime(dt: datetime) -> str:
-    """Formata datetime de forma humanizada"""
-    now = datetime.now()
-    diff = now - dt
+def parse_int(value) -> Optional[int]:
+    """
+    Converte int, float ou string numérica para int sem usar try/except.
+    Retorna None para qualquer outro valor.
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        value = value.strip()
+        digits = value[1:] if value[:1] in ("-", "+") else value
+        if digits.isdecimal():
+            return int(value)
+    return None
+
+
+def humanize_datetime(timestamp: int, now: int) -> str:
+    """
+    Formata um timestamp Unix de forma humanizada.
+    `now` é lido uma vez por requisição e repassado para todas as linhas.
+    """
+    seconds = now - timestamp
 
-    if diff.total_seconds() < 60:
-        seconds = int(diff.total_seconds())
+    if seconds < 60:
         return f"há {seconds} segundo{'s' if seconds != 1 else ''}"
-    elif diff.total_seconds() < 3600:
-        minutes = int(diff.total_seconds() / 60)
+    elif seconds < 3600:
+        minutes = seconds // 60
         return f"há {minutes} minuto{'s' if minutes != 1 else ''}"
-    elif diff.total_seconds() < 86400:
-        hours = int(diff.total_seconds() / 3600)
+    elif seconds < 86400:
+        hours = seconds // 3600
         return f"há {hours} hora{'s' if hours != 1 else ''}"
-    elif diff.days < 7:
-        days = diff.days
+    elif seconds < 604800:
+        days = seconds // 86400
         return f"há {days} dia{'s' if days != 1 else ''}"
     else:
-        return dt.strftime("%d/%m/%Y %H:%M:%S")
+        # Único caso que precisa de datetime
+        return datetime.fromtimestamp(timestamp).strftime("%d/%m/%Y %H:%M:%S")
 
 
-def calculate_tag_position(
-    gateway_lat: float, gateway_lon: float, tag_mac: str, tag_index: int
-) -> Tuple[float, float]:
+def calculate_tag_positions(
+    gateway_lat: float, gateway_lon: float, tag_macs: Sequence[str]
+) -> List[Tuple[float, float]]:
     """
-    Calcula posição da tag próxima ao gateway (1-3 metros de distância).
-    Usa hash do MAC para distribuir tags em círculo ao redor do gateway.
+    Calcula posições das tags próximas a um gateway (1-3 metros de distância).
+    Usa hash do MAC para distribuir tags em círculo ao redor do gateway e a
+    posição na lista como índice para evitar sobreposição.
     """
-    # Gera um número determinístico baseado no MAC
-    mac_hash = int(hashlib.md5(tag_mac.encode()).hexdigest(), 16)
-    
-    # Distância em metros (1 a 3 metros)
-    # Usa o hash para determinar a distância de forma determinística
-    distance_meters = 1.0 + (mac_hash % 200) / 100.0  # 1.0 a 3.0 metros
-    
-    # Ângulo em radianos (distribui em círculo completo)
-    # Usa tag_index para evitar sobreposição de tags do mesmo gateway
-    angle_rad = (mac_hash % 360) * (math.pi / 180.0) + (tag_index * 0.5)
-    
-    # Raio da Terra em metros
-    earth_radius = 6371000
-    
-    # Converte distância em metros para graus
+    # Converte distância em metros para graus (calculado uma vez por gateway)
     # 1 grau de latitude ≈ 111 km
     # 1 grau de longitude ≈ 111 km * cos(latitude)
-    lat_offset = (distance_meters / 111000) * math.cos(angle_rad)
-    lon_offset = (distance_meters / (111000 * math.cos(math.radians(gateway_lat)))) * math.sin(angle_rad)
-    
-    tag_lat = gateway_lat + lat_offset
-    tag_lon = gateway_lon + lon_offset
-    
-    return tag_lat, tag_lon
+    lat_scale = 1 / 111000
+    lon_scale = 1 / (111000 * math.cos(math.radians(gateway_lat)))
+
+    positions = []
+    for tag_index, tag_mac in enumerate(tag_macs):
+        # Gera um número determinístico baseado no MAC. O hash() do Python
+        # muda a cada processo, o que faria a tag "pular" entre workers
+        mac_hash = zlib.crc32(tag_mac.encode())
+
+        # Distância em metros (1.0 a 3.0 metros)
+        distance_meters = 1.0 + (mac_hash % 200) / 100.0
+
+        # Ângulo em radianos (distribui em círculo completo)
+        angle_rad = (mac_hash % 360) * (math.pi / 180.0) + (tag_index * 0.5)
+
+        positions.append(
+            (
+                round(
+                    gateway_lat + distance_meters * lat_scale * math.cos(angle_rad),
+                    TAG_COORDINATE_DECIMALS,
+                ),
+                round(
+                    gateway_lon + distance_meters * lon_scale * math.sin(angle_rad),
+                    TAG_COORDINATE_DECIMALS,
+                ),
+            )
+        )
+
+    return positions
+
+
+def gateway_coordinates(gateway: Optional[GatewayModel]) -> Optional[Tuple[float, float]]:
+    """Retorna (latitude, longitude) do gateway, se houver geolocation"""
+    if not gateway or not isinstance(gateway.geolocation, dict):
+        return None
+    lat = gateway.geolocation.get("latitude")
+    lon = gateway.geolocation.get("longitude")
+    if lat is None or lon is None:
+        return None
+    return lat, lon
+
+
+def encode_history_entry(row) -> bytes:
+    """Serializa uma linha (timestamp, rssi, gateway_mac) como TagHistoryEntry"""
+    return orjson.dumps(
+        {
+            "timestamp": row.timestamp,
+            "rssi": row.rssi,
+            "gateway": row.gateway_mac or "unknown",
+        }
+    )
+
+
+def build_stats(tags: Sequence[TagModel], now: int) -> bytes:
+    """
+    Monta o JSON do /stats a partir da última leitura de cada tag.
+    Função síncrona (só CPU) para poder rodar em uma thread.
+    """
+    threshold = now - 10
+
+    # Agrupa tags por gateway para calcular as posições em lote
+    tags_by_gateway = {}
+    for tag in tags:
+        coords = gateway_coordinates(tag.gateway)
+        if coords:
+            tags_by_gateway.setdefault(tag.gateway_mac, (coords, []))[1].append(tag.mac)
+
+    positions = {}
+    for (gateway_lat, gateway_lon), macs in tags_by_gateway.values():
+        positions.update(
+            zip(macs, calculate_tag_positions(gateway_lat, gateway_lon, macs))
+        )
+
+    stats = []
+    for tag in tags:
+        presence = "present" if tag.timestamp >= threshold else "absent"
+        tag_lat, tag_lon = positions.get(tag.mac, (None, None))
+
+        # Monta o dict direto: o response_model do /stats serve só para a documentação
+        stats.append(
+            {
+                "mac": tag.mac,
+                "last_rssi": tag.rssi,
+                "gateway": tag.gateway_mac or "unknown",
+                "last_seen": tag.timestamp,
+                "last_seen_humanized": humanize_datetime(tag.timestamp, now),
+                "presence": presence,
+                "latitude": tag_lat,
+                "longitude": tag_lon,
+            }
+        )
+
+    return orjson.dumps(stats)
 
 
 router = APIRouter()
 
 
 @router.post("/ingest")
-async def ingest(
-    payload: IngestRequest, db: AsyncSession = Depends(get_session_dependency)
-):
+async def ingest(payload: IngestRequest):
     """
     Recebe pacotes do gateway BLE/MQTT e atualiza dados das tags.
     Também salva histórico de cada leitura.
+    As leituras são gravadas em lote pelo flusher de ingest_queue.
     """
-    gateway = payload.gw or "unknown"
-    all_tags = []
+    # gateway_mac fica None se o gateway não informar um MAC válido; gateways
+    # não cadastrados viram None na gravação (ver ingest_queue._insert)
+    gateway = parse_mac(payload.gw)
+    # Leituras sem "tm" usam o horário de chegada do pacote; leituras com "tm"
+    # fora dos dias que têm partição são descartadas (cairiam em tags_default)
+    now = int(time.time())
+    window_start, window_end = ingest_window(now)
+    rows = []
+    out_of_window = 0
     for item in payload.adv:
-        mac = item.get("mac")
-        rssi = item.get("rssi")
+        mac = parse_mac(item.get("mac"))
+        rssi = parse_int(item.get("rssi"))
         battery_level = item.get("battery")
-        timestamp = item.get("tm")
-        if not mac or rssi is None:
+        timestamp = parse_int(item.get("tm"))
+        if mac is None or rssi is None:
             continue
 
-        mac = mac.lower()
-
-        try:
-            rssi = int(rssi)
-        except (ValueError, TypeError):
+        if timestamp is None:
+            timestamp = now
+        elif not window_start <= timestamp <= window_end:
+            out_of_window += 1
             continue
 
-        try:
-            ts = int(timestamp) if timestamp else int(time.time())
-            # Converte timestamp para datetime
-            dt = datetime.fromtimestamp(ts)
-        except (ValueError, TypeError):
-            dt = datetime.now()
-
         # Salva dados atuais (gateway_mac pode ser None se o gateway não existir)
-        all_tags.append(TagModel(mac=mac, rssi=rssi, gateway_mac=gateway, timestamp=dt, battery_level=battery_level))
+        rows.append(
+            {
+                "mac": mac,
+                "rssi": rssi,
+                "gateway_mac": gateway,
+                "timestamp": timestamp,
+                "battery_level": battery_level,
+            }
+        )
 
-    if all_tags:
-        db.add_all(all_tags)
-        await db.flush()  # Flush para garantir que os IDs sejam gerados se necessário
-        # Commit é feito automaticamente pela dependência
+    if out_of_window:
+        logger.warning(
+            "%d leituras do gateway %s descartadas: tm fora de [%d, %d]",
+            out_of_window,
+            payload.gw,
+            window_start,
+            window_end,
+        )
+
+    if rows:
+        await enqueue(rows)
 
-    return {"status": "ok", "inserted": len(all_tags)}
+    return {"status": "queued", "queued": len(rows), "dropped": out_of_window}
 
 
 @router.get("/stats", response_model=List[TagStatsResponse])
 async def list_all_stats(db: AsyncSession = Depends(get_session_dependency)):
     """Lista todas as tags com seus dados mais recentes"""
-    now = datetime.now()
-    threshold = now - timedelta(seconds=10)
-
-    # Busca a última entrada de cada MAC com join no gateway
-    subquery = (
-        select(TagModel.mac, func.max(TagModel.timestamp).label("max_timestamp"))
-        .group_by(TagModel.mac)
-        .subquery()
-    )
+    # Dashboards consultam este endpoint a cada poucos segundos
+    cached = await get_cached(STATS_KEY)
+    if cached:
+        return Response(content=cached, media_type="application/json")
 
+    now = int(time.time())
+
+    # DISTINCT ON (mac) com ORDER BY mac, timestamp DESC fica com a leitura
+    # mais recente de cada MAC, percorrendo o índice idx_mac_ts_desc_covering
+    # na ordem; o gateway é carregado com um único SELECT ... WHERE mac IN (...)
     query = (
-        select(TagModel, GatewayModel)
-        .outerjoin(
-            GatewayModel, TagModel.gateway_mac == GatewayModel.mac
-        )
-        .join(
-            subquery,
-            (TagModel.mac == subquery.c.mac)
-            & (TagModel.timestamp == subquery.c.max_timestamp),
-        )
+        select(TagModel)
+        .distinct(TagModel.mac)
+        .order_by(TagModel.mac, TagModel.timestamp.desc())
+        .options(selectinload(TagModel.gateway))
     )
 
     result = await db.execute(query)
-    rows = result.all()
-
-    # Agrupa tags por gateway para calcular índices
-    gateway_tag_counts = {}
-    stats = []
-    
-    for row in rows:
-        tag, gateway = row
-        presence = "present" if tag.timestamp >= threshold else "absent"
-        
-        # Calcula coordenadas se o gateway tiver geolocation
-        tag_lat = None
-        tag_lon = None
-        
-        if gateway and gateway.geolocation:
-            geoloc = gateway.geolocation
-            if isinstance(geoloc, dict):
-                gateway_lat = geoloc.get("latitude")
-                gateway_lon = geoloc.get("longitude")
-                
-                if gateway_lat is not None and gateway_lon is not None:
-                    # Conta quantas tags já foram processadas para este gateway
-                    gateway_key = tag.gateway_mac or "unknown"
-                    if gateway_key not in gateway_tag_counts:
-                        gateway_tag_counts[gateway_key] = 0
-                    tag_index = gateway_tag_counts[gateway_key]
-                    gateway_tag_counts[gateway_key] += 1
-                    
-                    # Calcula posição da tag próxima ao gateway
-                    tag_lat, tag_lon = calculate_tag_position(
-                        gateway_lat, gateway_lon, tag.mac, tag_index
-                    )
-        
-        stats.append(
-            TagStatsResponse(
-                mac=tag.mac,
-                last_rssi=tag.rssi,
-                gateway=tag.gateway_mac or "unknown",
-                last_seen=int(tag.timestamp.timestamp()),
-                last_seen_humanized=humanize_datetime(tag.timestamp),
-                presence=presence,
-                latitude=tag_lat,
-                longitude=tag_lon,
-            )
-        )
+    tags = result.scalars().all()
 
-    return stats
+    # Hash, trigonometria e serialização rodam fora do event loop
+    content = await asyncio.to_thread(build_stats, tags, now)
+    await set_cached(STATS_KEY, content, settings.STATS_CACHE_TTL)
+    return Response(content=content, media_type="application/json")
 
 
 @router.get("/stats/{mac}", response_model=TagStatsResponse)
 async def get_stats(mac: str, db: AsyncSession = Depends(get_session_dependency)):
     """Retorna dados mais recentes de uma tag específica"""
-    mac = mac.lower()
+    mac = parse_mac(mac)
+    if mac is None:
+        raise HTTPException(status_code=404, detail="MAC não encontrado")
 
-    # Busca a última entrada deste MAC com join no gateway
+    # Busca a última entrada deste MAC junto com o gateway
     query = (
-        select(TagModel, GatewayModel)
-        .outerjoin(GatewayModel, TagModel.gateway_mac == GatewayModel.mac)
+        select(TagModel)
+        .options(selectinload(TagModel.gateway))
         .where(TagModel.mac == mac)
         .order_by(desc(TagModel.timestamp))
         .limit(1)
     )
 
     result = await db.execute(query)
-    row = result.first()
+    tag = result.scalar_one_or_none()
 
-    if not row:
+    if not tag:
         raise HTTPException(status_code=404, detail="MAC não encontrado")
 
-    tag, gateway = row
-
-    now = datetime.now()
-    threshold = now - timedelta(seconds=10)
+    now = int(time.time())
+    threshold = now - 10
     presence = "present" if tag.timestamp >= threshold else "absent"
 
     # Calcula coordenadas se o gateway tiver geolocation
     tag_lat = None
     tag_lon = None
 
-    if gateway and gateway.geolocation:
-        geoloc = gateway.geolocation
-        if isinstance(geoloc, dict):
-            gateway_lat = geoloc.get("latitude")
-            gateway_lon = geoloc.get("longitude")
-
-            if gateway_lat is not None and gateway_lon is not None:
-                # Para uma única tag, usa índice 0
-                tag_lat, tag_lon = calculate_tag_position(
-                    gateway_lat, gateway_lon, tag.mac, 0
-                )
+    coords = gateway_coordinates(tag.gateway)
+    if coords:
+        # Para uma única tag, usa índice 0
+        tag_lat, tag_lon = calculate_tag_positions(*coords, [tag.mac])[0]
 
     return TagStatsResponse(
         mac=tag.mac,
         last_rssi=tag.rssi,
         gateway=tag.gateway_mac or "unknown",
-        last_seen=int(tag.timestamp.timestamp()),
-        last_seen_humanized=humanize_datetime(tag.timestamp),
+        last_seen=tag.timestamp,
+        last_seen_humanized=humanize_datetime(tag.timestamp, now),
         presence=presence,
         latitude=tag_lat,
         longitude=tag_lon,
@@ -258,40 +325,51 @@ async def get_history(
     """
     Retorna histórico de leituras de uma tag específica.
     Pode filtrar por intervalo de tempo e limitar quantidade de resultados.
+    A resposta é enviada em streaming, uma entrada por vez.
     """
-    mac = mac.lower()
-
-    # Verifica se a tag existe
-    check_query = select(TagModel).where(TagModel.mac == mac).limit(1)
-    check_result = await db.execute(check_query)
-    if not check_result.scalar_one_or_none():
+    mac_bytes = parse_mac(mac)
+    if mac_bytes is None:
         raise HTTPException(status_code=404, detail="MAC não encontrado")
+    mac = mac_bytes.hex(":")
 
-    # Constrói query base
+    # Constrói query base (só as colunas da resposta, sem instanciar TagModel)
     query = (
-        select(TagModel).where(TagModel.mac == mac).order_by(desc(TagModel.timestamp))
+        select(TagModel.timestamp, TagModel.rssi, TagModel.gateway_mac)
+        .where(TagModel.mac == mac_bytes)
+        .order_by(desc(TagModel.timestamp))
     )
 
     # Aplica filtros de tempo se fornecidos
     if start_time:
-        start_dt = datetime.fromtimestamp(start_time)
-        query = query.where(TagModel.timestamp >= start_dt)
+        query = query.where(TagModel.timestamp >= start_time)
 
     if end_time:
-        end_dt = datetime.fromtimestamp(end_time)
-        query = query.where(TagModel.timestamp <= end_dt)
+        query = query.where(TagModel.timestamp <= end_time)
 
     # Aplica limite
     query = query.limit(limit)
 
-    result = await db.execute(query)
-    tags = result.scalars().all()
-
-    entries = [
-        TagHistoryEntry(
-            timestamp=int(tag.timestamp.timestamp()), rssi=tag.rssi, gateway=tag.gateway_mac or "unknown"
-        )
-        for tag in tags
-    ]
-
-    return TagHistoryResponse(mac=mac, entries=entries, total=len(entries))
+    # Cursor no servidor: as linhas são enviadas conforme chegam do banco
+    result = await db.stream(query)
+    first = await anext(result, None)
+
+    # Só consulta a existência quando não há entradas, para diferenciar
+    # MAC desconhecido de intervalo vazio
+    if first is None:
+        await result.close()
+        exists_query = select(exists().where(TagModel.mac == mac_bytes))
+        if not await db.scalar(exists_query):
+            raise HTTPException(status_code=404, detail="MAC não encontrado")
+
+    async def encode_history():
+        yield b'{"mac":%b,"entries":[' % orjson.dumps(mac)
+        total = 0
+        if first is not None:
+            yield encode_history_entry(first)
+            total = 1
+            async for row in result:
+                yield b"," + encode_history_entry(row)
+                total += 1
+        yield b'],"total":%d}' % total
+
+    return StreamingResponse(encode_history(), media_type="application/json")
@@ -3,7 +3,8 @@ from sqlalchemy import or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from database import GatewayModel, get_session_dependency
+from database import GatewayModel, get_session_dependency, parse_mac
+from routers.endpoints.map import invalidate_gateways_cache
 from schemas import Gateway, GatewayUpdate
 
 router = APIRouter()
@@ -17,7 +18,9 @@ def keep_alnum(s: str) -> str:
 # Util 
 async def get_gateway(mac: str, db: AsyncSession) -> GatewayModel:
     """Busca um gateway pelo MAC"""
-    mac = keep_alnum(mac.lower())
+    mac = parse_mac(keep_alnum(mac))
+    if mac is None:
+        raise HTTPException(status_code=404, detail="Gateway not found")
     result = await db.execute(select(GatewayModel).where(GatewayModel.mac == mac))
     gateway = result.scalar_one_or_none()
     if not gateway:
@@ -29,7 +32,9 @@ async def get_gateway(mac: str, db: AsyncSession) -> GatewayModel:
 async def create_gateway(
     gateway: Gateway, db: AsyncSession = Depends(get_session_dependency)
 ):
-    mac = keep_alnum(gateway.mac.lower())
+    mac = parse_mac(keep_alnum(gateway.mac))
+    if mac is None:
+        raise HTTPException(status_code=422, detail="Invalid MAC address")
 
     result = await db.execute(
         select(GatewayModel).where(
@@ -40,10 +45,13 @@ async def create_gateway(
         raise HTTPException(status_code=409, detail="Gateway already exists")
 
     new_gateway = GatewayModel(
-        mac=mac, name=gateway.name, geolocation=gateway.geolocation.__dict__
+        mac=mac, name=gateway.name, geolocation=gateway.geolocation.model_dump()
     )
     db.add(new_gateway)
-    await db.flush()  # Flush para garantir que o ID seja gerado
+    # Commit aqui, e não só no fim da dependency (que roda depois da resposta
+    # ser enviada), para que o mapa não volte a guardar a lista antiga em cache
+    await db.commit()
+    invalidate_gateways_cache()
     await db.refresh(new_gateway)  # Refresh para garantir que temos todos os dados
     return new_gateway
 
@@ -60,12 +68,13 @@ async def update_gateway(
         existing_gateway.name = gateway.name
     
     if gateway.geolocation is not None:
-        geolocation_dict = gateway.geolocation.__dict__ if hasattr(gateway.geolocation, '__dict__') else gateway.geolocation
+        geolocation_dict = gateway.geolocation.model_dump()
         if existing_gateway.geolocation != geolocation_dict:
             existing_gateway.geolocation = geolocation_dict
     
-    # Flush para garantir que as mudanças sejam aplicadas antes do commit automático
-    await db.flush()
+    # Commit antes de invalidar o cache do mapa (ver create_gateway)
+    await db.commit()
+    invalidate_gateways_cache()
     
     return existing_gateway
 
@@ -1,304 +1,125 @@
 """Router para visualização de gateways e tags em mapa"""
-import json
-from fastapi import APIRouter, Depends
+import hashlib
+import re
+import time
+from pathlib import Path
+from typing import Optional, Tuple
+
+import orjson
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import HTMLResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from database import GatewayModel, get_session_dependency
+from settings import settings
+from static_assets import asset_version
 
 router = APIRouter()
 
+# Casas decimais das coordenadas dos gateways (5 casas ≈ 1,1 m), suficiente
+# para os marcadores do mapa
+COORDINATE_DECIMALS = 5
+
+TEMPLATES_DIR = Path(__file__).resolve().parents[2] / "templates"
+
+# %%VERSION:<arquivo>%% vira o hash do conteúdo de static/<arquivo>, para que
+# o link mude quando o arquivo muda (ver static_assets.py)
+_ASSET_VERSION = re.compile(rb"%%VERSION:([\w./-]+)%%")
+
+# A página não depende do banco (os gateways vêm de /map/gateways.json), então
+# os bytes do arquivo são lidos e preenchidos uma vez só
+_shell = _ASSET_VERSION.sub(
+    lambda match: asset_version(match.group(1).decode()).encode(),
+    (TEMPLATES_DIR / "map.html").read_bytes(),
+)
+_shell_etag = '"' + hashlib.md5(_shell).hexdigest() + '"'
+
+# Último payload de /map/gateways.json: (instante em que foi montado, corpo, ETag).
+# Cada worker tem o seu; o TTL limita o atraso de mudanças feitas em outro worker
+_gateways_cache: Optional[Tuple[float, bytes, str]] = None
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """Indica se o cliente já tem a versão com este ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return any(tag in (etag, "*") for tag in tags)
+
 
 @router.get("/", response_class=HTMLResponse)
-async def map_view(db: AsyncSession = Depends(get_session_dependency)):
+async def map_view(request: Request):
     """Renderiza HTML com mapa mostrando gateways e tags"""
-    
-    # Busca todos os gateways
-    result = await db.execute(select(GatewayModel))
-    gateways = result.scalars().all()
-    
-    # Prepara os dados dos gateways para o JavaScript
-    gateways_data = []
-    for gw in gateways:
-        geoloc = gw.geolocation
-        if isinstance(geoloc, dict):            
-            gateways_data.append({
-                "name": gw.name,
-                "mac": gw.mac,
-                "lat": geoloc["latitude"],
-                "lon": geoloc["longitude"]
-            })
-    
-    # Gera o HTML com Leaflet
-    html_content = f"""
-    <!DOCTYPE html>
-    <html lang="pt-BR">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Mapa de Gateways e Tags</title>
-        <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css" />
-        <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.css" />
-        <link rel="stylesheet" href="https://unpkg.com/leaflet.markercluster@1.5.3/dist/MarkerCluster.Default.css" />
-        <style>
-            body {{
-                margin: 0;
-                padding: 0;
-                font-family: Arial, sans-serif;
-            }}
-            #map {{
-                height: 100vh;
-                width: 100%;
-            }}
-            .info-panel {{
-                position: absolute;
-                top: 10px;
-                right: 10px;
-                background: white;
-                padding: 15px;
-                border-radius: 5px;
-                box-shadow: 0 2px 5px rgba(0,0,0,0.3);
-                z-index: 1000;
-                max-width: 300px;
-                max-height: 80vh;
-                overflow-y: auto;
-            }}
-            .info-panel h2 {{
-                margin-top: 0;
-                font-size: 18px;
-            }}
-            .info-panel h3 {{
-                font-size: 14px;
-                margin: 10px 0 5px 0;
-                color: #666;
-            }}
-            .gateway-item {{
-                padding: 8px;
-                margin: 5px 0;
-                background: #f5f5f5;
-                border-radius: 3px;
-                border-left: 3px solid #007bff;
-            }}
-            .gateway-item strong {{
-                color: #007bff;
-            }}
-            .tag-item {{
-                padding: 6px;
-                margin: 3px 0;
-                background: #fff3cd;
-                border-radius: 3px;
-                border-left: 3px solid #ffc107;
-                font-size: 12px;
-            }}
-            .tag-item strong {{
-                color: #856404;
-            }}
-            .loading {{
-                text-align: center;
-                padding: 10px;
-                color: #666;
-            }}
-            /* Efeito de pulso para gateways (radiofrequência) */
-            @keyframes pulse {{
-                0% {{
-                    transform: scale(1);
-                    opacity: 1;
-                }}
-                50% {{
-                    transform: scale(1.5);
-                    opacity: 0.5;
-                }}
-                100% {{
-                    transform: scale(2);
-                    opacity: 0;
-                }}
-            }}
-            .gateway-pulse {{
-                position: absolute;
-                border-radius: 50%;
-                background-color: #007bff;
-                animation: pulse 2s infinite;
-                pointer-events: none;
-            }}
-            .gateway-marker-container {{
-                position: relative;
-            }}
-        </style>
-    </head>
-    <body>
-        <div id="map"></div>
-        <div class="info-panel">
-            <h2>Dispositivos</h2>
-            <h3>Gateways ({len(gateways_data)})</h3>
-            <div id="gateways-list">
-                {"".join([f'<div class="gateway-item"><strong>{gw["name"]}</strong><br><small>MAC: {gw["mac"]}</small></div>' for gw in gateways_data])}
-            </div>
-            <h3>Tags</h3>
-            <div id="tags-list" class="loading">Carregando tags...</div>
-        </div>
-        
-        <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
-        <script src="https://unpkg.com/leaflet.markercluster@1.5.3/dist/leaflet.markercluster.js"></script>
-        <script>
-            // Dados dos gateways
-            const gateways = {json.dumps(gateways_data)};
-            
-            // Inicializa o mapa
-            let map;
-            if (gateways.length > 0) {{
-                // Calcula o centro baseado nos gateways
-                const avgLat = gateways.reduce((sum, gw) => sum + gw.lat, 0) / gateways.length;
-                const avgLon = gateways.reduce((sum, gw) => sum + gw.lon, 0) / gateways.length;
-                
-                map = L.map('map').setView([avgLat, avgLon], 13);
-            }} else {{
-                // Se não houver gateways, usa uma localização padrão (Brasil)
-                map = L.map('map').setView([-14.2350, -51.9253], 4);
-            }}
-            
-            // Adiciona tile layer do OpenStreetMap
-            L.tileLayer('https://{{s}}.tile.openstreetmap.org/{{z}}/{{x}}/{{y}}.png', {{
-                attribution: '© OpenStreetMap contributors',
-                maxZoom: 19
-            }}).addTo(map);
-            
-            // Cria grupos de marcadores para clustering
-            const gatewayMarkers = L.markerClusterGroup();
-            const tagMarkers = L.markerClusterGroup();
-            
-            // Ícone personalizado para gateways (azul) com efeito de pulso
-            const gatewayIcon = L.divIcon({{
-                className: 'gateway-marker-container',
-                html: `
-                    <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0;"></div>
-                    <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0; animation-delay: 0.5s;"></div>
-                    <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0; animation-delay: 1s;"></div>
-                    <div style="position: relative; background-color: #007bff; width: 20px; height: 20px; border-radius: 50%; border: 3px solid white; box-shadow: 0 2px 4px rgba(0,0,0,0.3); z-index: 10;"></div>
-                `,
-                iconSize: [20, 20],
-                iconAnchor: [10, 10]
-            }});
-            
-            // Ícone personalizado para tags (amarelo/laranja)
-            const tagIcon = L.divIcon({{
-                className: 'tag-marker',
-                html: '<div style="background-color: #ffc107; width: 15px; height: 15px; border-radius: 50%; border: 2px solid white; box-shadow: 0 2px 4px rgba(0,0,0,0.3);"></div>',
-                iconSize: [15, 15],
-                iconAnchor: [7, 7]
-            }});
-            
-            // Adiciona marcadores para cada gateway
-            gateways.forEach(gw => {{
-                const marker = L.marker([gw.lat, gw.lon], {{ icon: gatewayIcon }});
-                marker.bindPopup(`
-                    <b>${{gw.name}}</b><br>
-                    <strong>Gateway</strong><br>
-                    MAC: ${{gw.mac}}<br>
-                    Coordenadas: ${{gw.lat.toFixed(6)}}, ${{gw.lon.toFixed(6)}}
-                `);
-                gatewayMarkers.addLayer(marker);
-            }});
-            
-            map.addLayer(gatewayMarkers);
-            map.addLayer(tagMarkers);
-            
-            // Busca dados das tags do endpoint /stats
-            async function loadTags() {{
-                try {{
-                    const response = await fetch('/stats');
-                    const tags = await response.json();
-                    
-                    // Salva informações sobre popups abertos antes de limpar
-                    let openPopupInfo = null;
-                    tagMarkers.eachLayer(function(marker) {{
-                        if (marker.isPopupOpen()) {{
-                            // Salva o MAC da tag que tinha popup aberto
-                            const popupContent = marker.getPopup().getContent();
-                            const macMatch = popupContent.match(/<b>([^<]+)<\/b>/);
-                            if (macMatch) {{
-                                openPopupInfo = {{
-                                    mac: macMatch[1],
-                                    lat: marker.getLatLng().lat,
-                                    lon: marker.getLatLng().lng
-                                }};
-                            }}
-                        }}
-                    }});
-                    
-                    // Limpa marcadores de tags existentes antes de adicionar novos
-                    tagMarkers.clearLayers();
-                    
-                    // Atualiza lista de tags no painel
-                    const tagsList = document.getElementById('tags-list');
-                    if (tags.length === 0) {{
-                        tagsList.innerHTML = '<div class="loading">Nenhuma tag encontrada</div>';
-                    }} else {{
-                        tagsList.innerHTML = tags.map(tag => `
-                            <div class="tag-item">
-                                <strong>${{tag.mac}}</strong><br>
-                                <small>RSSI: ${{tag.last_rssi}} | ${{tag.presence}}</small>
-                            </div>
-                        `).join('');
-                    }}
-                    
-                    // Adiciona marcadores para tags com coordenadas
-                    const tagsWithCoords = tags.filter(tag => tag.latitude && tag.longitude);
-                    let markerToReopen = null;
-                    
-                    tagsWithCoords.forEach(tag => {{
-                        const marker = L.marker([tag.latitude, tag.longitude], {{ icon: tagIcon }});
-                        const presenceColor = tag.presence === 'present' ? '#28a745' : '#dc3545';
-                        marker.bindPopup(`
-                            <b>${{tag.mac}}</b><br>
-                            <strong>Tag BLE</strong><br>
-                            RSSI: ${{tag.last_rssi}} dBm<br>
-                            Gateway: ${{tag.gateway}}<br>
-                            Status: <span style="color: ${{presenceColor}}">${{tag.presence}}</span><br>
-                            Última vez: ${{tag.last_seen_humanized}}<br>
-                            Coordenadas: ${{tag.latitude.toFixed(6)}}, ${{tag.longitude.toFixed(6)}}
-                        `);
-                        tagMarkers.addLayer(marker);
-                        
-                        // Se este marcador corresponde ao que tinha popup aberto, marca para reabrir
-                        if (openPopupInfo && tag.mac === openPopupInfo.mac) {{
-                            markerToReopen = marker;
-                        }}
-                    }});
-                    
-                    // Reabre o popup se estava aberto antes
-                    if (markerToReopen) {{
-                        setTimeout(() => {{
-                            markerToReopen.openPopup();
-                        }}, 100);
-                    }}
-                    
-                    // Ajusta o zoom para mostrar todos os dispositivos (apenas na primeira carga)
-                    if (gateways.length > 0 || tagsWithCoords.length > 0) {{
-                        const allMarkers = [];
-                        gateways.forEach(gw => allMarkers.push(L.marker([gw.lat, gw.lon])));
-                        tagsWithCoords.forEach(tag => allMarkers.push(L.marker([tag.latitude, tag.longitude])));
-                        const group = new L.featureGroup(allMarkers);
-                        // Só ajusta zoom se o mapa ainda não foi ajustado
-                        if (!map._initialBoundsSet) {{
-                            map.fitBounds(group.getBounds().pad(0.1));
-                            map._initialBoundsSet = true;
-                        }}
-                    }}
-                }} catch (error) {{
-                    console.error('Erro ao carregar tags:', error);
-                    document.getElementById('tags-list').innerHTML = '<div class="loading" style="color: red;">Erro ao carregar tags</div>';
-                }}
-            }}
-            
-            // Carrega tags ao inicializar
-            loadTags();
-            
-            // Atualiza tags a cada 10 segundos
-            setInterval(loadTags, 10000);
-        </script>
-    </body>
-    </html>
-    """
-    
-    return HTMLResponse(content=html_content)
+    headers = {"ETag": _shell_etag, "Cache-Control": "public, max-age=300"}
+    if not_modified(request, _shell_etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=_shell, media_type="text/html", headers=headers)
+
+
+def invalidate_gateways_cache() -> None:
+    """Descarta o payload em cache; chamado quando um gateway é criado ou alterado"""
+    global _gateways_cache
+    _gateways_cache = None
+
+
+async def load_gateways_payload(db: AsyncSession) -> Tuple[bytes, str]:
+    """Retorna (corpo, ETag) de /map/gateways.json, do cache ou do banco"""
+    global _gateways_cache
+    if (
+        _gateways_cache
+        and time.monotonic() - _gateways_cache[0] < settings.GATEWAYS_CACHE_TTL
+    ):
+        return _gateways_cache[1], _gateways_cache[2]
+
+    # Busca só as colunas usadas no mapa; latitude e longitude são extraídas
+    # do JSON pelo próprio Postgres (geolocation->>'latitude')
+    latitude = GatewayModel.geolocation["latitude"].as_float()
+    longitude = GatewayModel.geolocation["longitude"].as_float()
+    query = select(GatewayModel.name, GatewayModel.mac, latitude, longitude).where(
+        latitude.is_not(None), longitude.is_not(None)
+    )
+
+    # Arrays paralelos em vez de um objeto por gateway: as chaves não se
+    # repetem no JSON e coords ([lat, lon, lat, lon, ...]) vira um
+    # Float64Array no navegador. Tudo, inclusive as somas do centro, é montado
+    # numa única passada pelas linhas, lidas em lotes por um cursor no servidor
+    names = []
+    macs = []
+    coords = []
+    lat_sum = lon_sum = 0.0
+    async for name, mac, lat, lon in await db.stream(query):
+        names.append(name)
+        macs.append(mac)
+        coords.append(round(lat, COORDINATE_DECIMALS))
+        coords.append(round(lon, COORDINATE_DECIMALS))
+        lat_sum += lat
+        lon_sum += lon
+
+    # Centro do mapa (média dos gateways), calculado uma vez aqui em vez de
+    # em cada navegador; None mantém a vista padrão da página
+    center = None
+    if names:
+        center = [
+            round(lat_sum / len(names), COORDINATE_DECIMALS),
+            round(lon_sum / len(names), COORDINATE_DECIMALS),
+        ]
+
+    body = orjson.dumps(
+        {"names": names, "macs": macs, "coords": coords, "center": center}
+    )
+    etag = '"' + hashlib.md5(body).hexdigest() + '"'
+    _gateways_cache = (time.monotonic(), body, etag)
+    return body, etag
+
 
+@router.get("/gateways.json")
+async def list_map_gateways(
+    request: Request, db: AsyncSession = Depends(get_session_dependency)
+):
+    """Lista gateways com coordenadas para o mapa e o centro inicial do mapa"""
+    body, etag = await load_gateways_payload(db)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=60"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,14 +1,20 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from pydantic_extra_types.coordinate import Latitude, Longitude
 from typing import Optional
 
 
 class Geolocation(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     latitude: Latitude
     longitude: Longitude
 
-    def __dict__(self):
-        return {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+    def to_geojson(self) -> dict:
+        """Representação GeoJSON (Point) da coordenada"""
+        return {
+            "type": "Point",
+            "coordinates": [float(self.longitude), float(self.latitude)],
+        }
 
 
 class TagStatsResponse(BaseModel): ...
@@ -0,0 +1,202 @@
+// Dados dos gateways, carregados de /map/gateways.json: arrays paralelos,
+// com coords = [lat, lon, lat, lon, ...]
+let gateways = { names: [], macs: [], coords: new Float64Array(0) };
+
+// Inicializa o mapa numa localização padrão (Brasil); o mapa é
+// centralizado no centro calculado pelo servidor quando os gateways
+// forem carregados
+const map = L.map('map').setView([-14.2350, -51.9253], 4);
+
+// Adiciona tile layer do OpenStreetMap
+L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    attribution: '© OpenStreetMap contributors',
+    maxZoom: 19
+}).addTo(map);
+
+// Cria grupos de marcadores para clustering
+const gatewayMarkers = L.markerClusterGroup();
+const tagMarkers = L.markerClusterGroup();
+
+// Ícone personalizado para gateways (azul) com efeito de pulso
+const gatewayIcon = L.divIcon({
+    className: 'gateway-marker-container',
+    html: `
+        <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0;"></div>
+        <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0; animation-delay: 0.5s;"></div>
+        <div class="gateway-pulse" style="width: 20px; height: 20px; left: 0; top: 0; animation-delay: 1s;"></div>
+        <div style="position: relative; background-color: #007bff; width: 20px; height: 20px; border-radius: 50%; border: 3px solid white; box-shadow: 0 2px 4px rgba(0,0,0,0.3); z-index: 10;"></div>
+    `,
+    iconSize: [20, 20],
+    iconAnchor: [10, 10]
+});
+
+// Ícone personalizado para tags (amarelo/laranja)
+const tagIcon = L.divIcon({
+    className: 'tag-marker',
+    html: '<div style="background-color: #ffc107; width: 15px; height: 15px; border-radius: 50%; border: 2px solid white; box-shadow: 0 2px 4px rgba(0,0,0,0.3);"></div>',
+    iconSize: [15, 15],
+    iconAnchor: [7, 7]
+});
+
+map.addLayer(gatewayMarkers);
+map.addLayer(tagMarkers);
+
+// Escapa texto vindo da API antes de usá-lo em innerHTML ou em popups;
+// nomes de gateway são livres (POST /gateway) e não podem virar markup
+const HTML_ESCAPES = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' };
+function escapeHtml(value) {
+    return String(value).replace(/[&<>"']/g, char => HTML_ESCAPES[char]);
+}
+
+// Busca dados dos gateways do endpoint /map/gateways.json
+async function loadGateways() {
+    const gatewaysList = document.getElementById('gateways-list');
+    let data;
+    try {
+        const response = await fetch('/map/gateways.json');
+        data = await response.json();
+        gateways = {
+            names: data.names,
+            macs: data.macs,
+            coords: Float64Array.from(data.coords)
+        };
+    } catch (error) {
+        console.error('Erro ao carregar gateways:', error);
+        gatewaysList.innerHTML = '<div class="loading" style="color: red;">Erro ao carregar gateways</div>';
+        return;
+    }
+
+    // Monta a lista do painel e os marcadores numa única passada
+    let gatewayItems = '';
+    const markers = [];
+    const { names, macs, coords } = gateways;
+    for (let i = 0; i < names.length; i++) {
+        const lat = coords[2 * i];
+        const lon = coords[2 * i + 1];
+        const name = escapeHtml(names[i]);
+        const mac = escapeHtml(macs[i]);
+        gatewayItems += `<div class="gateway-item"><strong>${name}</strong><br><small>MAC: ${mac}</small></div>`;
+
+        const marker = L.marker([lat, lon], { icon: gatewayIcon });
+        marker.bindPopup(`
+            <b>${name}</b><br>
+            <strong>Gateway</strong><br>
+            MAC: ${mac}<br>
+            Coordenadas: ${lat.toFixed(6)}, ${lon.toFixed(6)}
+        `);
+        markers.push(marker);
+    }
+
+    // Atualiza lista de gateways no painel
+    document.getElementById('gateways-count').textContent = names.length;
+    gatewaysList.classList.remove('loading');
+    gatewaysList.innerHTML = gatewayItems;
+
+    // addLayers agrupa os marcadores de uma vez no cluster
+    gatewayMarkers.addLayers(markers);
+
+    // Centro médio dos gateways, calculado pelo servidor
+    if (data.center) {
+        map.setView(data.center, 13);
+    }
+}
+
+// Busca dados das tags do endpoint /stats
+async function loadTags() {
+    try {
+        const response = await fetch('/stats');
+        const tags = await response.json();
+
+        // Salva informações sobre popups abertos antes de limpar
+        let openPopupInfo = null;
+        tagMarkers.eachLayer(function(marker) {
+            if (marker.isPopupOpen()) {
+                // Salva o MAC da tag que tinha popup aberto
+                const popupContent = marker.getPopup().getContent();
+                const macMatch = popupContent.match(/<b>([^<]+)<\/b>/);
+                if (macMatch) {
+                    openPopupInfo = {
+                        mac: macMatch[1],
+                        lat: marker.getLatLng().lat,
+                        lon: marker.getLatLng().lng
+                    };
+                }
+            }
+        });
+
+        // Limpa marcadores de tags existentes antes de adicionar novos
+        tagMarkers.clearLayers();
+
+        // Atualiza lista de tags no painel
+        const tagsList = document.getElementById('tags-list');
+        if (tags.length === 0) {
+            tagsList.innerHTML = '<div class="loading">Nenhuma tag encontrada</div>';
+        } else {
+            tagsList.innerHTML = tags.map(tag => `
+                <div class="tag-item">
+                    <strong>${tag.mac}</strong><br>
+                    <small>RSSI: ${tag.last_rssi} | ${tag.presence}</small>
+                </div>
+            `).join('');
+        }
+
+        // Adiciona marcadores para tags com coordenadas
+        const tagsWithCoords = tags.filter(tag => tag.latitude && tag.longitude);
+        let markerToReopen = null;
+
+        tagsWithCoords.forEach(tag => {
+            const marker = L.marker([tag.latitude, tag.longitude], { icon: tagIcon });
+            const presenceColor = tag.presence === 'present' ? '#28a745' : '#dc3545';
+            marker.bindPopup(`
+                <b>${tag.mac}</b><br>
+                <strong>Tag BLE</strong><br>
+                RSSI: ${tag.last_rssi} dBm<br>
+                Gateway: ${tag.gateway}<br>
+                Status: <span style="color: ${presenceColor}">${tag.presence}</span><br>
+                Última vez: ${tag.last_seen_humanized}<br>
+                Coordenadas: ${tag.latitude.toFixed(6)}, ${tag.longitude.toFixed(6)}
+            `);
+            tagMarkers.addLayer(marker);
+
+            // Se este marcador corresponde ao que tinha popup aberto, marca para reabrir
+            if (openPopupInfo && tag.mac === openPopupInfo.mac) {
+                markerToReopen = marker;
+            }
+        });
+
+        // Reabre o popup se estava aberto antes
+        if (markerToReopen) {
+            setTimeout(() => {
+                markerToReopen.openPopup();
+            }, 100);
+        }
+
+        // Ajusta o zoom para mostrar todos os dispositivos (apenas na primeira carga)
+        if (gateways.names.length > 0 || tagsWithCoords.length > 0) {
+            const allMarkers = [];
+            const coords = gateways.coords;
+            for (let i = 0; i < coords.length; i += 2) {
+                allMarkers.push(L.marker([coords[i], coords[i + 1]]));
+            }
+            tagsWithCoords.forEach(tag => allMarkers.push(L.marker([tag.latitude, tag.longitude])));
+            const group = new L.featureGroup(allMarkers);
+            // Só ajusta zoom se o mapa ainda não foi ajustado
+            if (!map._initialBoundsSet) {
+                map.fitBounds(group.getBounds().pad(0.1));
+                map._initialBoundsSet = true;
+            }
+        }
+    } catch (error) {
+        console.error('Erro ao carregar tags:', error);
+        document.getElementById('tags-list').innerHTML = '<div class="loading" style="color: red;">Erro ao carregar tags</div>';
+    }
+}
+
+// Carrega gateways e depois as tags; o ajuste de zoom das tags usa
+// as posições dos gateways
+loadGateways().then(() => {
+    loadTags();
+
+    // Atualiza tags a cada 10 segundos
+    setInterval(loadTags, 10000);
+});
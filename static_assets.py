@@ -0,0 +1,35 @@
+"""
+Arquivos de /static com versão no link (?v=<hash do conteúdo>).
+
+Cada arquivo tem o seu hash, então mudar um não invalida o cache dos outros.
+Só uma URL com a versão atual do arquivo é servida como "immutable"; sem
+?v= ou com uma versão antiga o navegador revalida normalmente pelo ETag.
+"""
+
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import parse_qs
+
+from fastapi.staticfiles import StaticFiles
+
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+
+
+@lru_cache
+def asset_version(name: str) -> str:
+    """Hash do conteúdo de static/<name>, lido uma vez por processo"""
+    return hashlib.md5((STATIC_DIR / name).read_bytes()).hexdigest()[:12]
+
+
+class VersionedStaticFiles(StaticFiles):
+    """StaticFiles com cache longo para URLs que levam a versão atual do arquivo"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        name = Path(os.path.relpath(full_path, STATIC_DIR)).as_posix()
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("v") == [asset_version(name)]:
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response